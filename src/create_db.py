@@ -3,6 +3,52 @@ import sqlite3
 import os
 import sys
 import argparse # <--- Import argparse
+import itertools # For slicing bulk-insert batches
+
+# How many Cabinet rows to bind per executemany call during bulk loads.
+BULK_INSERT_BATCH_SIZE = 10000
+
+def bulk_insert_cabinets(conn, rows):
+    """
+    Inserts Cabinet rows in bulk: one transaction, executemany in batches.
+
+    Loaders should use this instead of per-row cursor.execute — a single
+    BEGIN ... COMMIT around parameterized executemany is the biggest
+    SQLite insert win (one fsync for the whole load instead of one per
+    statement). Rows may be any iterable of 11-tuples matching the
+    Cabinet column order; they are consumed in batches so a generator
+    can stream them without materializing the whole list.
+
+    Args:
+        conn: An open sqlite3 connection to the catalog database.
+        rows: Iterable of (CatalogName, Name, Game, CreationDate, Version,
+              RomName, Url, Description, Core, Creator, Notes) tuples.
+
+    Returns:
+        int: Number of rows inserted.
+    """
+    sql = """
+        INSERT INTO Cabinet (
+            CatalogName, Name, Game, CreationDate, Version, RomName,
+            Url, Description, Core, Creator, Notes
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    inserted = 0
+    rows_iter = iter(rows)
+    conn.execute("BEGIN")
+    try:
+        while True:
+            batch = list(itertools.islice(rows_iter, BULK_INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            conn.executemany(sql, batch)
+            inserted += len(batch)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return inserted
 
 def initialize_database(db_path):
     """
@@ -30,25 +76,33 @@ def initialize_database(db_path):
     conn = None
     try:
         conn = sqlite3.connect(db_path)
+        # Autocommit at the Python layer: the script below controls its own
+        # transaction, so the driver never injects implicit BEGINs/commits.
+        conn.isolation_level = None
         cursor = conn.cursor()
         print("Database connection established.")
 
-        # --- Enable Foreign Key Support ---
-        cursor.execute("PRAGMA foreign_keys = ON;")
-        print("-> Executed: PRAGMA foreign_keys = ON;")
+        # --- Pragmas + all DDL in one executescript ---
+        # The pragmas (WAL + synchronous=NORMAL etc.) avoid an fsync per
+        # statement and also benefit the bulk loads the other scripts run
+        # against this same database file later. One BEGIN IMMEDIATE ...
+        # COMMIT means one fsync for all the DDL, and a single script means
+        # one parse/prepare round instead of one per statement.
+        cursor.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-65536;
+            PRAGMA foreign_keys=ON;
+
+            BEGIN IMMEDIATE;
 
-        # --- Create Catalog Table ---
-        cursor.execute("""
             CREATE TABLE IF NOT EXISTS Catalog (
                 CatalogName TEXT PRIMARY KEY NOT NULL,
                 Description TEXT,
                 url TEXT
             );
-        """)
-        print("-> Executed: CREATE TABLE IF NOT EXISTS Catalog")
 
-        # --- Create Cabinet Table ---
-        cursor.execute("""
             CREATE TABLE IF NOT EXISTS Cabinet (
                 CatalogName TEXT NOT NULL,
                 Name TEXT NOT NULL,
@@ -61,33 +115,41 @@ def initialize_database(db_path):
                 Core TEXT,
                 Creator TEXT,
                 Notes TEXT
-                );
-        """)
+            );
 
-        # --- Create BuildInfo Table ---  <-- ADD THIS SECTION -->
-        cursor.execute("""
             CREATE TABLE IF NOT EXISTS BuildInfo (
                 BuildTag TEXT PRIMARY KEY NOT NULL,
                 BuildCommitSHA TEXT NOT NULL,
                 BuildTimestampUTC TEXT NOT NULL
             );
+
+            CREATE INDEX IF NOT EXISTS idx_cabinet_name ON Cabinet (Name);
+
+            -- Catalog browsing filters by (CatalogName, Name); this composite
+            -- index covers that path (the commented-out PK would have).
+            CREATE INDEX IF NOT EXISTS idx_cabinet_cat_name ON Cabinet (CatalogName, Name);
+
+            -- Partial index: rows without a Creator are never looked up by
+            -- it, and skipping the NULLs keeps the B-tree much smaller.
+            DROP INDEX IF EXISTS idx_cabinet_creator;
+            CREATE INDEX IF NOT EXISTS idx_cabinet_creator_notnull
+                ON Cabinet (Creator) WHERE Creator IS NOT NULL;
+
+            COMMIT;
         """)
+        print("-> Executed: performance PRAGMAs (WAL, synchronous=NORMAL, temp_store, cache_size)")
+        print("-> Executed: PRAGMA foreign_keys = ON;")
+        print("-> Executed: CREATE TABLE IF NOT EXISTS Catalog")
+        print("-> Executed: CREATE TABLE IF NOT EXISTS Cabinet")
         print("-> Executed: CREATE TABLE IF NOT EXISTS BuildInfo")
+        print("-> Executed: CREATE INDEX IF NOT EXISTS idx_cabinet_name")
+        print("-> Executed: CREATE INDEX IF NOT EXISTS idx_cabinet_cat_name")
+        print("-> Executed: CREATE INDEX IF NOT EXISTS idx_cabinet_creator_notnull")
 
         #PRIMARY KEY (CatalogName, Name),
         #FOREIGN KEY (CatalogName) REFERENCES Catalog(CatalogName) ON DELETE CASCADE
-            
-        print("-> Executed: CREATE TABLE IF NOT EXISTS Cabinet")
 
-        # --- Create Indexes for Performance ---
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cabinet_name ON Cabinet (Name);")
-        print("-> Executed: CREATE INDEX IF NOT EXISTS idx_cabinet_name")
-
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cabinet_creator ON Cabinet (Creator);")
-        print("-> Executed: CREATE INDEX IF NOT EXISTS idx_cabinet_creator")
-
-        # --- Commit the changes ---
-        conn.commit()
+        # The script above already committed its own transaction.
         print("Database structural changes committed.")
         print("Database structure initialized/verified successfully.")
         initialized_successfully = True
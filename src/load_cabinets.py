@@ -3,9 +3,32 @@ import sqlite3
 import os
 import sys
 import csv
+import io
+import itertools
+import logging
 import requests # For downloading URLs
-import io       # For handling downloaded text as a file
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed # For parallel catalog downloads
+from db_common import tune_connection
+
+# Diagnostics go through logging instead of per-row print(file=sys.stderr):
+# the handler buffers and the logging call is cheaper than a flushed print
+# when a catalog has many bad rows.
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# Only advertise brotli when a decoder is importable (same check requests
+# uses for its default header). Without one, urllib3 passes a br body
+# through undecoded and the loader would parse garbage.
+try:
+    import brotli # noqa: F401 -- presence check only; urllib3 does the decoding
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
 
 # --- Constants for CSV Column Indices (0-based) ---
 # Match these to your expected CSV structure (based on C# example)
@@ -20,25 +43,225 @@ IDX_CORE = 7
 IDX_CREATOR = 8
 IDX_NOTES = 9
 
-# Minimum columns expected in a valid data row (Name, Url, Game are required by DB schema)
-MIN_REQUIRED_COLUMNS = 1
+# How many validated rows to accumulate before pushing them to SQLite in
+# one executemany call.
+BATCH_SIZE = 1000
+
+# How many catalog CSVs to download in parallel.
+MAX_CATALOG_WORKERS = 8
+
+# Module-level so every catalog reuses the same statement object in the
+# driver's prepared-statement cache. Rows land in the attached in-memory
+# staging database first; one INSERT..SELECT moves them into main.Cabinet
+# at the end of the run.
+SQL_INSERT_CABINET = """
+    INSERT INTO staging.Cabinet (
+        CatalogName, Name, Game, CreationDate, Version, RomName,
+        Url, Description, Core, Creator, Notes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Number of CSV columns the insert consumes (IDX_NAME..IDX_NOTES).
+NUM_COLUMNS = 10
+
+def _insert_batch(cursor, sql_insert, batch):
+    """
+    Inserts a batch of Cabinet rows with executemany. If the batch fails,
+    falls back to per-row execute so the offending rows are reported
+    individually, mirroring the old per-row error handling.
+
+    Returns:
+        tuple: (rows_inserted, rows_failed) for this batch.
+    """
+    try:
+        cursor.executemany(sql_insert, batch)
+        return len(batch), 0
+    except sqlite3.Error:
+        inserted = 0
+        failed = 0
+        for data_tuple in batch:
+            try:
+                cursor.execute(sql_insert, data_tuple)
+                inserted += 1
+            except sqlite3.IntegrityError as e:
+                log.warning(f"  DB Integrity Error for Name '{data_tuple[1]}': {e}. Skipping row.")
+                failed += 1
+            except sqlite3.Error as e:
+                log.warning(f"  DB Error for Name '{data_tuple[1]}': {e}. Skipping row.")
+                failed += 1
+        return inserted, failed
+
+def _open_catalog_stream(session, catalog_url, etag=None, last_modified=None):
+    """
+    Opens a streaming GET for a catalog CSV. Run by the download workers;
+    the body is consumed later on the main thread.
+
+    When validators from a previous fetch are supplied, the request is
+    conditional and the server may answer 304 Not Modified (empty body) —
+    the caller checks status_code for that.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = session.get(catalog_url, timeout=60, stream=True, headers=headers) # 60 second timeout
+    response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+    # iter_lines needs an encoding to decode; default to utf-8
+    response.encoding = response.encoding or 'utf-8'
+    return response
+
+def _process_catalog_csv(conn, cursor, catalog_name, catalog_url, response, verbose=False,
+                         simple_csv=False):
+    """
+    Parses one catalog's streaming CSV response and bulk-inserts its rows
+    into the staging Cabinet table inside a single transaction; the caller
+    flushes staging into main.Cabinet once all catalogs are done. Per-row
+    skip diagnostics are
+    only printed when verbose is set; the summary line always is.
+
+    With simple_csv, rows are split on bare commas instead of going through
+    csv.reader — faster, but only correct for catalogs whose fields never
+    contain quoted commas.
+
+    Returns:
+        bool: True if the catalog processed cleanly, False if processing
+              failed and the transaction was rolled back.
+    """
+    rows_processed = 0
+    rows_inserted = 0
+    rows_failed = 0
 
-def _get_value_or_none(row, index):
-    """Safely gets a value from a list (CSV row) by index, returning None if index is out of bounds."""
     try:
-        # Return None if the value is empty string, otherwise return the value
-        value = row[index].strip()
-        return value if value else None
-    except IndexError:
-        return None
+        # Feed the response straight into the parser: memory stays O(row)
+        # instead of holding the whole body (plus a StringIO copy), and
+        # parsing overlaps with the download.
+        if simple_csv:
+            # str.split skips csv.reader's quoting state machine; maxsplit
+            # keeps anything past the last consumed column in one field,
+            # matching how the slice below treats extra columns. This path
+            # assumes no quoting, so blank and '#'-comment lines can be
+            # dropped at the raw line level.
+            lines = (ln for ln in response.iter_lines(decode_unicode=True)
+                     if ln and not ln.startswith('#'))
+            reader = (ln.split(',', NUM_COLUMNS) for ln in lines)
+        else:
+            # csv.reader must see a real file object, not iter_lines():
+            # quoted fields may legally span lines, and a line iterator
+            # strips the embedded newlines (silently mutating the field).
+            # decode_content handles gzip/deflate before the text layer.
+            # Assuming standard comma delimiter. Adjust delimiter=',' if needed (e.g., for TSV use '\t')
+            response.raw.decode_content = True
+            # urllib3 closes raw at EOF by default, which TextIOWrapper
+            # trips over when it reads past the end; the response is still
+            # closed explicitly in the finally below.
+            response.raw.auto_close = False
+            text_stream = io.TextIOWrapper(response.raw, encoding=response.encoding or 'utf-8', newline='')
+            reader = csv.reader(text_stream, delimiter=',') # Specify delimiter if not comma
+
+        # Skip leading comment/blank records, then a header row if the
+        # catalog ships one; checked once up front instead of branching on
+        # every row of the loop. Comments are dropped *after* parsing on
+        # the csv.reader path so a quoted multi-line field whose
+        # continuation line happens to start with '#' is never clipped.
+        first_row = next(iter(reader), None)
+        while first_row is not None and (not first_row or first_row[0].startswith('#')):
+            first_row = next(reader, None)
+        if first_row is None:
+            rows = iter(())
+        elif first_row[0].strip().lower() == 'name':
+            rows = reader
+        else:
+            rows = itertools.chain([first_row], reader)
+
+        batch = []
+
+        # One explicit (deferred) transaction per catalog. Only the
+        # in-memory staging database is written here, so this never takes
+        # the main database's writer lock, and a ROLLBACK below discards
+        # exactly this catalog's staged rows.
+        cursor.execute("BEGIN")
+
+        for i, row in enumerate(rows):
+            # Drop blank and '#'-comment records mid-file too (the
+            # simple-csv branch already filtered them at the line level).
+            if not row or row[0].startswith('#'):
+                continue
+            rows_processed += 1
+
+            # Extract data: pad short rows once, then strip every cell in a
+            # single comprehension ('' becomes None) instead of one guarded
+            # helper call per column. Empty/short rows pad to all-None and
+            # fall out on the Name check below.
+            if len(row) < NUM_COLUMNS:
+                row = row + [""] * (NUM_COLUMNS - len(row))
+            # map(str.strip, ...) runs the strip calls in one C-level loop
+            # (str.strip already returns the same object for clean cells).
+            (name, url_cabinet, game, creation_date, version, rom_name,
+             description, core, creator, notes) = [
+                s or None for s in map(str.strip, row[:NUM_COLUMNS])
+            ]
+
+            # Single validation branch (Name is the one NOT NULL field);
+            # the f-string diagnostic is only built with --verbose, so bad
+            # rows in a mostly-good catalog don't pay for stderr writes.
+            if not name:
+                rows_failed += 1
+                if verbose:
+                    log.warning(f"  Skipping row {i + 1}: Required field 'Name' (column {IDX_NAME + 1}) is missing or empty.")
+                continue
+
+            # Prepare data tuple for insertion (order must match SQL)
+            data_tuple = (
+                catalog_name, name, game, creation_date, version, rom_name,
+                url_cabinet, description, core, creator, notes
+            )
+
+            # Accumulate and bulk-insert; one executemany per batch
+            # replaces a statement dispatch per row.
+            batch.append(data_tuple)
+            if len(batch) >= BATCH_SIZE:
+                inserted, failed = _insert_batch(cursor, SQL_INSERT_CABINET, batch)
+                rows_inserted += inserted
+                rows_failed += failed
+                batch.clear()
+
+        # Flush the final partial batch
+        if batch:
+            inserted, failed = _insert_batch(cursor, SQL_INSERT_CABINET, batch)
+            rows_inserted += inserted
+            rows_failed += failed
+            batch.clear()
+
+        # --- Commit after processing all rows for the current catalog's CSV ---
+        cursor.execute("COMMIT")
+        print(f"  Finished processing '{catalog_name}'. Rows processed: {rows_processed}, Inserted: {rows_inserted}, Failed/Skipped: {rows_failed}")
+        return True
+
+    except csv.Error as e:
+        log.error(f"  Error parsing CSV data for catalog '{catalog_name}' from URL {catalog_url}: {e}")
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK") # Roll back any partial inserts from this file if parsing fails mid-way
+        return False
+    except Exception as e:
+        log.error(f"  An unexpected error occurred processing CSV data for '{catalog_name}': {e}")
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return False
+    finally:
+        response.close()
 
-def load_cabinets_from_catalogs(db_path):
+def load_cabinets_from_catalogs(db_path, verbose=False, simple_csv=False):
     """
     Reads catalogs from the database, downloads associated CSV files,
     parses them, and loads data into the Cabinet table.
 
     Args:
         db_path (str): Path to the SQLite database file.
+        verbose (bool): If True, print a stderr diagnostic for every
+            skipped CSV row instead of only the per-catalog summary.
+        simple_csv (bool): If True, split rows on bare commas instead of
+            full CSV parsing. Only safe for catalogs without quoted fields.
 
     Returns:
         bool: True if the overall process completed (though individual errors may have occurred),
@@ -55,15 +278,30 @@ def load_cabinets_from_catalogs(db_path):
     overall_success = True
     catalogs_processed = 0
     catalogs_failed_download = 0
+    catalogs_skipped_unchanged = 0
+    pending_cache_updates = []
 
     try:
-        conn = sqlite3.connect(db_path)
+        # isolation_level=None: autocommit at the Python layer, transactions
+        # below are opened and closed explicitly so the driver never
+        # auto-BEGINs between rows. cached_statements is raised above the
+        # default 100 so the insert/pragma statements never fall out of the
+        # driver's prepared-statement cache.
+        conn = sqlite3.connect(db_path, cached_statements=256, isolation_level=None)
+        tune_connection(conn)
         cursor = conn.cursor()
         print("Database connection established.")
 
         # Enable Foreign Keys
         cursor.execute("PRAGMA foreign_keys = ON;")
 
+        # Stage all inserts in an attached in-memory database: per-catalog
+        # transactions touch only staging (no WAL frame churn, no writer
+        # lock on the main file), and one INSERT..SELECT at the end moves
+        # everything into main.Cabinet as a single sequential write.
+        cursor.execute("ATTACH ':memory:' AS staging")
+        cursor.execute("CREATE TABLE staging.Cabinet AS SELECT * FROM main.Cabinet WHERE 0")
+
         # --- 1. Read the Catalog table ---
         cursor.execute("SELECT CatalogName, url FROM Catalog")
         catalogs_to_process = cursor.fetchall()
@@ -74,127 +312,110 @@ def load_cabinets_from_catalogs(db_path):
 
         print(f"Found {len(catalogs_to_process)} catalogs to process.")
 
-        # --- 2. Loop through each catalog ---
+        # Sidecar cache of HTTP validators from previous runs. It lives in
+        # its own table (not columns on Catalog) because load_yaml.py wipes
+        # and reloads Catalog on every build; this table survives.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS CatalogFetchCache (
+                url TEXT PRIMARY KEY NOT NULL,
+                ETag TEXT,
+                LastModified TEXT
+            )
+        """)
+        cursor.execute("SELECT url, ETag, LastModified FROM CatalogFetchCache")
+        fetch_cache = {url: (etag, lm) for url, etag, lm in cursor.fetchall()}
+
+        # --- 2. Fetch catalogs concurrently; insert as downloads complete ---
+        # Downloads are independent and network-bound, so a small thread
+        # pool overlaps them while all SQLite work stays on this thread
+        # (the connection is not shared across threads). One shared Session
+        # reuses TCP connections between catalogs on the same host.
+        session = requests.Session()
+        # CSVs compress ~5-10x; the stack decompresses transparently before
+        # the parser sees the bytes. ACCEPT_ENCODING includes br only when
+        # a brotli decoder is actually importable.
+        session.headers.update({"Accept-Encoding": ACCEPT_ENCODING})
+
+        valid_catalogs = []
         for catalog_name, catalog_url in catalogs_to_process:
-            catalogs_processed += 1
-            print(f"\n--- Processing Catalog: '{catalog_name}' ---")
-            print(f"  URL: {catalog_url}")
-
             if not catalog_url or not catalog_url.strip():
-                print(f"  Warning: Skipping catalog '{catalog_name}' due to missing or empty URL.", file=sys.stderr)
+                catalogs_processed += 1
+                print(f"\n--- Processing Catalog: '{catalog_name}' ---")
+                log.warning(f"  Warning: Skipping catalog '{catalog_name}' due to missing or empty URL.")
                 continue
-
-            # --- 3. Download the CSV file ---
-            csv_content = None
-            try:
-                response = requests.get(catalog_url, timeout=60) # 60 second timeout
-                response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-                csv_content = response.text
-                print(f"  Successfully downloaded content from URL.")
-            except requests.exceptions.RequestException as e:
-                print(f"  Error downloading URL for catalog '{catalog_name}': {e}", file=sys.stderr)
-                catalogs_failed_download += 1
-                continue # Skip to the next catalog
-            except Exception as e:
-                print(f"  An unexpected error occurred during download for catalog '{catalog_name}': {e}", file=sys.stderr)
-                catalogs_failed_download += 1
-                continue # Skip to the next catalog
-
-            if not csv_content:
-                print(f"  Warning: Downloaded content for '{catalog_name}' is empty. Skipping processing.", file=sys.stderr)
-                continue
-
-            # --- 4. Process the CSV data ---
-            rows_processed = 0
-            rows_inserted = 0
-            rows_failed = 0
-
-            try:
-                # Use io.StringIO to treat the string content like a file
-                # Use csv.reader to handle CSV parsing complexities (quoting, commas in fields)
-                # Assuming standard comma delimiter. Adjust delimiter=',' if needed (e.g., for TSV use '\t')
-                csvfile = io.StringIO(csv_content)
-                reader = csv.reader(csvfile, delimiter=',') # Specify delimiter if not comma
-
-                sql_insert = """
-                    INSERT INTO Cabinet (
-                        CatalogName, Name, Game, CreationDate, Version, RomName,
-                        Url, Description, Core, Creator, Notes
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-
-                for i, row in enumerate(reader):
-                    rows_processed += 1
-                    row_number = i + 1 # 1-based index for logging
-
-                    # Basic row validation (minimum columns)
-                    if len(row) < MIN_REQUIRED_COLUMNS:
-                        print(f"  Skipping row {row_number}: has only {len(row)} columns, expected at least {MIN_REQUIRED_COLUMNS}.", file=sys.stderr)
-                        rows_failed += 1
-                        continue
-
-                    # Extract data using indices
-                    name = _get_value_or_none(row, IDX_NAME)
-                    
-                    # --- Validation based on DB Schema (NOT NULL fields) ---
-                    if not name:
-                        print(f"  Skipping row {row_number}: Required field 'Name' (column {IDX_NAME + 1}) is missing or empty.", file=sys.stderr)
-                        rows_failed += 1
-                        continue
-
-
-                    # Extract optional fields
-                    creation_date = _get_value_or_none(row, IDX_CREATION_DATE)
-                    version = _get_value_or_none(row, IDX_VERSION)
-                    rom_name = _get_value_or_none(row, IDX_ROM_NAME)
-                    description = _get_value_or_none(row, IDX_DESCRIPTION)
-                    core = _get_value_or_none(row, IDX_CORE)
-                    creator = _get_value_or_none(row, IDX_CREATOR)
-                    notes = _get_value_or_none(row, IDX_NOTES)
-                    url_cabinet = _get_value_or_none(row, IDX_URL_CABINET) # Cabinet specific URL
-                    game = _get_value_or_none(row, IDX_GAME)
-
-                    # Prepare data tuple for insertion (order must match SQL)
-                    data_tuple = (
-                        catalog_name, name, game, creation_date, version, rom_name,
-                        url_cabinet, description, core, creator, notes
-                    )
-
-                    # Insert into database
-                    try:
-                        cursor.execute(sql_insert, data_tuple)
-                        rows_inserted += 1
-                    except sqlite3.IntegrityError as e:
-                        # Should primarily catch PK violations if the processed_keys_in_catalog check fails,
-                        # or FK violations if catalog_name somehow doesn't exist (unlikely here).
-                        print(f"  DB Integrity Error on row {row_number} for Name '{name}': {e}. Skipping row.", file=sys.stderr)
-                        rows_failed += 1
-                        # No rollback needed here, let the transaction continue for other rows
-                    except sqlite3.Error as e:
-                        print(f"  DB Error on row {row_number} for Name '{name}': {e}. Skipping row.", file=sys.stderr)
-                        rows_failed += 1
-                        # No rollback needed here
-
-                # --- Commit after processing all rows for the current catalog's CSV ---
-                conn.commit()
-                print(f"  Finished processing '{catalog_name}'. Rows processed: {rows_processed}, Inserted: {rows_inserted}, Failed/Skipped: {rows_failed}")
-
-            except csv.Error as e:
-                print(f"  Error parsing CSV data for catalog '{catalog_name}' from URL {catalog_url}: {e}", file=sys.stderr)
-                conn.rollback() # Rollback any partial inserts from this file if parsing fails mid-way
-                rows_failed = rows_processed # Assume all rows failed if parsing failed
-                overall_success = False # Mark overall process potentially incomplete
-            except Exception as e:
-                print(f"  An unexpected error occurred processing CSV data for '{catalog_name}': {e}", file=sys.stderr)
-                conn.rollback()
-                rows_failed = rows_processed
-                overall_success = False
+            valid_catalogs.append((catalog_name, catalog_url))
+
+        with ThreadPoolExecutor(max_workers=MAX_CATALOG_WORKERS) as executor:
+            futures = {
+                executor.submit(_open_catalog_stream, session, url,
+                                *fetch_cache.get(url, (None, None))): (name, url)
+                for name, url in valid_catalogs
+            }
+            for future in as_completed(futures):
+                catalog_name, catalog_url = futures[future]
+                catalogs_processed += 1
+                print(f"\n--- Processing Catalog: '{catalog_name}' ---")
+                print(f"  URL: {catalog_url}")
+
+                try:
+                    response = future.result()
+                    print(f"  Successfully connected; streaming content from URL.")
+                except requests.exceptions.RequestException as e:
+                    log.error(f"  Error downloading URL for catalog '{catalog_name}': {e}")
+                    catalogs_failed_download += 1
+                    continue # Skip to the next catalog
+                except Exception as e:
+                    log.error(f"  An unexpected error occurred during download for catalog '{catalog_name}': {e}")
+                    catalogs_failed_download += 1
+                    continue # Skip to the next catalog
+
+                if response.status_code == 304:
+                    print(f"  Catalog unchanged since last run (304 Not Modified); skipping parse and insert.")
+                    catalogs_skipped_unchanged += 1
+                    response.close()
+                    continue
+
+                # --- 3. Parse and insert this catalog's rows (main thread) ---
+                if not _process_catalog_csv(conn, cursor, catalog_name, catalog_url, response,
+                                            verbose=verbose, simple_csv=simple_csv):
+                    overall_success = False # Mark overall process potentially incomplete
+                    continue
+
+                # Remember this fetch's validators only after a clean load;
+                # applied together with the final flush below so a failed
+                # run leaves the cache untouched too.
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    pending_cache_updates.append((catalog_url, etag, last_modified))
+
+        # --- 4. Flush staged rows into the main database in one pass ---
+        staged_rows = cursor.execute("SELECT COUNT(*) FROM staging.Cabinet").fetchone()[0]
+        cursor.execute("BEGIN IMMEDIATE")
+        # Validate FKs once at COMMIT instead of per staged row; a
+        # violation rolls the whole flush back. (Resets automatically
+        # when the transaction ends.)
+        cursor.execute("PRAGMA defer_foreign_keys=ON")
+        cursor.execute("INSERT INTO main.Cabinet SELECT * FROM staging.Cabinet")
+        cursor.executemany(
+            """
+            INSERT INTO CatalogFetchCache (url, ETag, LastModified)
+            VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                ETag = excluded.ETag,
+                LastModified = excluded.LastModified
+            """,
+            pending_cache_updates
+        )
+        cursor.execute("COMMIT")
+        print(f"\nFlushed {staged_rows} staged rows into the Cabinet table.")
 
         # --- End of catalog loop ---
         print("\n--- Cabinet Loading Summary ---")
         print(f"Catalogs found in DB: {len(catalogs_to_process)}")
         print(f"Catalogs processed attempt: {catalogs_processed}")
         print(f"Catalogs failed download: {catalogs_failed_download}")
+        print(f"Catalogs skipped (unchanged): {catalogs_skipped_unchanged}")
         print("-----------------------------")
 
 
@@ -226,6 +447,16 @@ if __name__ == "__main__":
         required=True,
         help="Path to the target SQLite database file (e.g., /path/to/data/marketplace.db)."
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print a diagnostic for every skipped CSV row (default: per-catalog summary only)."
+    )
+    parser.add_argument(
+        "--simple-csv",
+        action="store_true",
+        help="Split CSV rows on bare commas instead of full CSV parsing. Faster, but only correct for catalogs whose fields never contain quoted commas."
+    )
 
     # --- Parse Arguments ---
     args = parser.parse_args()
@@ -236,7 +467,7 @@ if __name__ == "__main__":
     print(f"Using Database Path for Cabinet Loading: {database_file_path}")
 
     # Call the main loading function
-    if load_cabinets_from_catalogs(database_file_path):
+    if load_cabinets_from_catalogs(database_file_path, verbose=args.verbose, simple_csv=args.simple_csv):
         print("\nCabinet loading script finished successfully.")
     else:
         print("\nCabinet loading script finished with critical errors or CSV processing issues.", file=sys.stderr)
@@ -3,7 +3,15 @@ import sqlite3
 import os
 import sys
 import yaml
-import argparse 
+import argparse
+from db_common import tune_connection
+
+# Prefer the libyaml-backed loader (same safe_load semantics, C-speed
+# parse); fall back when PyYAML was built without libyaml.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 def load_catalogs_from_yaml(db_path, yaml_path):
     """
@@ -30,7 +38,7 @@ def load_catalogs_from_yaml(db_path, yaml_path):
     catalogs_list = None
     try:
         with open(yaml_path, 'r') as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=SafeLoader)
             catalogs_list = data.get('marketplace')
             if catalogs_list is None:
                  print(f"Error: YAML file '{yaml_path}' is missing the top-level 'marketplace' key.", file=sys.stderr)
@@ -50,83 +58,76 @@ def load_catalogs_from_yaml(db_path, yaml_path):
         print(f"An unexpected error occurred reading YAML file '{yaml_path}': {e}", file=sys.stderr)
         return False
 
+    # --- Validate and dedupe the YAML entries (no DB needed yet) ---
+    # A dict keyed by CatalogName keeps the first occurrence and drops
+    # later duplicates, matching the old first-seen behaviour.
+    rows_by_name = {}
+    processed_yaml_entries = 0 # Track how many YAML entries we attempt to process
+
+    for item in catalogs_list:
+        processed_yaml_entries += 1
+        catalog_name = item.get('CatalogName')
+        description = item.get('Description')
+        url = item.get('Url') # Will be None if 'Url' key is missing
+
+        if not catalog_name:
+            print(f"Warning: Skipping entry {processed_yaml_entries} due to missing 'CatalogName': {item}", file=sys.stderr)
+            continue # Skip this entry if primary key is missing
+
+        # Check for duplicate CatalogName within this YAML load operation
+        if catalog_name in rows_by_name:
+            print(f"Warning: Duplicate 'CatalogName' found in YAML: '{catalog_name}'. Skipping subsequent entry {processed_yaml_entries}.", file=sys.stderr)
+            continue
+        rows_by_name[catalog_name] = (catalog_name, description, url)
+
     # --- Insert data into database ---
     conn = None
-    inserted_count = 0
-    processed_yaml_entries = 0 # Track how many YAML entries we attempt to process
-    has_errors = False
-    processed_keys = set() # Keep track of CatalogNames processed within this run to detect duplicates in YAML
 
     try:
-        conn = sqlite3.connect(db_path)
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        tune_connection(conn)
         cursor = conn.cursor()
         print("Database connection established for loading catalogs.")
 
         # Enable foreign keys for this connection
         cursor.execute("PRAGMA foreign_keys = ON;")
 
-        # --- Clear existing data from Catalog table ---
+        # Delete and reload in one transaction: either the new catalog set
+        # lands completely or the old one stays, and the whole load costs a
+        # single commit instead of one statement dispatch per entry.
+        cursor.execute("BEGIN IMMEDIATE")
+
         print("Deleting existing data from Catalog table...")
         cursor.execute("DELETE FROM Catalog;")
         print(f"-> Deleted {cursor.rowcount} rows from Catalog.")
 
-        # --- Insert new data ---
         sql = "INSERT INTO Catalog (CatalogName, Description, url) VALUES (?, ?, ?)"
+        cursor.executemany(sql, list(rows_by_name.values()))
 
-        for item in catalogs_list:
-            processed_yaml_entries += 1
-            catalog_name = item.get('CatalogName')
-            description = item.get('Description')
-            url = item.get('Url') # Will be None if 'Url' key is missing
-
-            if not catalog_name:
-                print(f"Warning: Skipping entry {processed_yaml_entries} due to missing 'CatalogName': {item}", file=sys.stderr)
-                continue # Skip this entry if primary key is missing
-
-            # Check for duplicate CatalogName within this YAML load operation
-            if catalog_name in processed_keys:
-                print(f"Warning: Duplicate 'CatalogName' found in YAML: '{catalog_name}'. Skipping subsequent entry {processed_yaml_entries}.", file=sys.stderr)
-                continue
-            processed_keys.add(catalog_name)
-
-            try:
-                cursor.execute(sql, (catalog_name, description, url))
-                inserted_count += 1
-
-            # Catch constraint errors (like PRIMARY KEY violation, although the check above should prevent it)
-            # or operational errors (like table missing).
-            except sqlite3.IntegrityError as ie:
-                 print(f"Error inserting catalog '{catalog_name}': {ie}. This might indicate a duplicate key despite checks.", file=sys.stderr)
-                 has_errors = True
-                 break # Stop processing on integrity errors
-            except sqlite3.OperationalError as oe:
-                 print(f"Error executing insert for '{catalog_name}': {oe}", file=sys.stderr)
-                 print("Does the 'Catalog' table exist? Ensure create_db.py was run correctly.", file=sys.stderr)
-                 has_errors = True
-                 break # Stop processing if table is missing or other operational issue
-            except sqlite3.Error as e:
-                print(f"Error inserting catalog '{catalog_name}': {e}", file=sys.stderr)
-                has_errors = True # Mark that an error occurred
-                # Decide if you want to continue processing other items or stop
-
-        if not has_errors:
-            conn.commit()
-            print(f"Catalog loading transaction committed. Inserted: {inserted_count} rows.")
-            return True
-        else:
-            print("Rolling back changes due to errors during loading.", file=sys.stderr)
-            conn.rollback()
-            return False
+        cursor.execute("COMMIT")
+        print(f"Catalog loading transaction committed. Inserted: {len(rows_by_name)} rows.")
+        return True
 
+    except sqlite3.IntegrityError as ie:
+        print(f"Error inserting catalogs: {ie}. This might indicate a duplicate key despite checks.", file=sys.stderr)
+        if conn and conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return False
+    except sqlite3.OperationalError as oe:
+        print(f"Error executing catalog load: {oe}", file=sys.stderr)
+        print("Does the 'Catalog' table exist? Ensure create_db.py was run correctly.", file=sys.stderr)
+        if conn and conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return False
     except sqlite3.Error as e:
-        print(f"An SQLite error occurred during catalog loading connection/setup: {e}", file=sys.stderr)
-        if conn:
-            conn.rollback()
+        print(f"An SQLite error occurred during catalog loading: {e}", file=sys.stderr)
+        if conn and conn.in_transaction:
+            cursor.execute("ROLLBACK")
         return False
     except Exception as e:
         print(f"An unexpected error occurred during catalog loading: {e}", file=sys.stderr)
-        if conn:
-            conn.rollback()
+        if conn and conn.in_transaction:
+            cursor.execute("ROLLBACK")
         return False
     finally:
         if conn:
@@ -4,11 +4,17 @@ import sys
 import argparse
 import datetime
 import re # Import regular expression module for more robust parsing
+from db_common import tune_connection
+
+# Leading digits of the version, with an optional 'v' prefix.
+# Compiled once at import; also handles suffixed tags like '1.2.3-rc1' or 'v1-beta'.
+_MAJOR_RE = re.compile(r'^v?(\d+)')
 
 def extract_major_version(tag_string):
     """
     Extracts the major version component from a Git tag string.
-    Handles formats like 'v1.2.3', '1.2.3', 'v1.2', '1.2', 'v1', '1'.
+    Handles formats like 'v1.2.3', '1.2.3', 'v1.2', '1.2', 'v1', '1',
+    as well as suffixed tags such as '1.2.3-rc1'.
 
     Args:
         tag_string (str): The full Git tag string.
@@ -20,25 +26,14 @@ def extract_major_version(tag_string):
     if not tag_string:
         return "" # Return empty if input is empty
 
-    # Remove potential leading 'v'
-    cleaned_tag = tag_string.lstrip('v')
-
-    # Split by '.' and take the first part
-    parts = cleaned_tag.split('.')
-    if parts:
-        major_version = parts[0]
-        # Basic check: ensure the first part isn't empty
-        if major_version:
-            print(f"    Extracted major version: '{major_version}' from tag '{tag_string}'")
-            return major_version
-        else:
-             # Handle cases like tag being just '.' or 'v.' resulting in empty first part
-             print(f"    Warning: Could not extract major version from tag '{tag_string}' after splitting. Using original tag.", file=sys.stderr)
-             return tag_string # Fallback to original tag
-    else:
-        # Should not happen if split is called on non-empty string, but defensive check
-        print(f"    Warning: Could not extract major version from tag '{tag_string}'. Using original tag.", file=sys.stderr)
-        return tag_string # Fallback to original tag
+    m = _MAJOR_RE.match(tag_string)
+    if m:
+        major_version = m.group(1)
+        print(f"    Extracted major version: '{major_version}' from tag '{tag_string}'")
+        return major_version
+
+    print(f"    Warning: Could not extract major version from tag '{tag_string}'. Using original tag.", file=sys.stderr)
+    return tag_string # Fallback to original tag
 
 def update_build_info(db_path, full_tag, commit_sha, timestamp):
     """
@@ -67,12 +62,19 @@ def update_build_info(db_path, full_tag, commit_sha, timestamp):
     conn = None
     try:
         conn = sqlite3.connect(db_path)
+        tune_connection(conn)
         cursor = conn.cursor()
 
-        # Use INSERT OR REPLACE. Note we now use major_version_tag for the first value.
+        # Upsert on BuildTag: unlike INSERT OR REPLACE, an existing row is
+        # updated in place rather than deleted and re-inserted, so the rowid
+        # survives and no delete-side triggers/cascades can fire.
+        # Note we now use major_version_tag for the first value.
         sql = """
-            INSERT OR REPLACE INTO BuildInfo (BuildTag, BuildCommitSHA, BuildTimestampUTC)
-            VALUES (?, ?, ?);
+            INSERT INTO BuildInfo (BuildTag, BuildCommitSHA, BuildTimestampUTC)
+            VALUES (?, ?, ?)
+            ON CONFLICT(BuildTag) DO UPDATE SET
+                BuildCommitSHA = excluded.BuildCommitSHA,
+                BuildTimestampUTC = excluded.BuildTimestampUTC;
         """
         # --- Use the extracted major version here ---
         cursor.execute(sql, (major_version_tag, commit_sha, timestamp))